@@ -4,18 +4,64 @@ OpenBeta Parquet Exporter
 Exports climbing route data from OpenBeta GraphQL API to Parquet format.
 """
 
+import argparse
+import hashlib
 import json
+import re
+import time
 import requests
 import duckdb
-import yaml
+import ijson
+import os
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
 import tempfile
+import yaml
+import zstandard
 from pathlib import Path
 from typing import Dict, List, Any, Tuple, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 
+try:
+    import orjson
+except ImportError:  # optional - falls back to stdlib json
+    orjson = None
+
 # Countries known to be too large for single query - skip straight to children
 LARGE_REGIONS = {"USA", "Canada"}
 
+# Parallel sub-region fetches when a country is split - kept below the
+# top-level concurrency so one large country can't take over the connection pool
+SUBREGION_CONCURRENCY = 6
+
+# Regions (" > "-joined paths) mapped to when they last timed out, persisted next
+# to the response cache so later runs split them straight away. Entries older than
+# timeout_memory_hours are dropped on load, so a one-off 502/504 doesn't stick.
+TIMED_OUT_REGIONS = {}
+
+# Countries with a region that failed to fetch during this run - their results
+# are incomplete, so they're left out of the response cache
+INCOMPLETE_COUNTRIES = set()
+
+# Shared HTTP session - reuses keep-alive connections to the API across requests.
+# POST isn't in urllib3's default allowed_methods, so only connection errors are
+# retried; 502/504 still reach fetch_region and trigger the split into children.
+SESSION = requests.Session()
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "User-Agent": "openbeta-parquet-exporter",
+})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+))
+
 # GraphQL query to fetch all countries with UUIDs
 COUNTRIES_QUERY = """
 query GetCountries {
@@ -49,49 +95,96 @@ query GetAreaByPath($tokens: [String!]!) {
 }
 """
 
-# GraphQL query to fetch areas with climbs for a specific country or region
-AREAS_QUERY = """
-query GetAreas($tokens: [String!]!) {
-  areas(filter: {leaf_status: {isLeaf: true}, path_tokens: {tokens: $tokens}}) {
-    uuid
-    area_name
-    pathTokens
-    metadata {
-      lat
-      lng
-    }
-    climbs {
-      uuid
-      name
-      fa
-      length
-      boltsCount
-      grades {
-        yds
-        vscale
-        french
-      }
-      type {
-        sport
-        trad
-        bouldering
-        alpine
-        tr
-      }
-      safety
-      metadata {
-        lat
-        lng
-      }
-      content {
-        description
-      }
-      pathTokens
-    }
-  }
+# Climb fields the exporter knows how to request, with their Arrow types.
+# The query and load schema are trimmed to the ones schema.sql uses.
+COORDINATES_TYPE = pa.struct([("lat", pa.float64()), ("lng", pa.float64())])
+CLIMB_FIELDS = {
+    "uuid": pa.string(),
+    "name": pa.string(),
+    "fa": pa.string(),
+    "length": pa.int64(),
+    "boltsCount": pa.int64(),
+    "grades": pa.struct([("yds", pa.string()), ("vscale", pa.string()), ("french", pa.string())]),
+    "type": pa.struct([
+        ("sport", pa.bool_()),
+        ("trad", pa.bool_()),
+        ("bouldering", pa.bool_()),
+        ("alpine", pa.bool_()),
+        ("tr", pa.bool_()),
+    ]),
+    "safety": pa.string(),
+    "metadata": COORDINATES_TYPE,
+    "content": pa.struct([("description", pa.string())]),
+    "pathTokens": pa.list_(pa.string()),
 }
+
+# Always requested - the climb id, plus the location fields CLIMBS_VIEW_SQL fills from the parent area
+REQUIRED_CLIMB_FIELDS = {"uuid", "metadata", "pathTokens"}
+
+# Flattens the fetched leaf areas into one row per climb, filling missing
+# pathTokens and coordinates from the parent area. uuid is cast to {uuid_type}:
+# UUID (what read_json_auto inferred) unless some id doesn't parse as one.
+CLIMBS_VIEW_SQL = """
+CREATE OR REPLACE TEMP VIEW climbs AS
+WITH area_climbs AS (
+    SELECT pathTokens AS area_pathTokens, metadata AS area_metadata, UNNEST(climbs) AS climb
+    FROM areas
+), flat AS (
+    SELECT area_pathTokens, area_metadata, UNNEST(climb)
+    FROM area_climbs
+)
+SELECT * EXCLUDE (area_pathTokens, area_metadata) REPLACE (
+    uuid::{uuid_type} AS uuid,
+    COALESCE(NULLIF(pathTokens, []), area_pathTokens) AS pathTokens,
+    CASE WHEN COALESCE(metadata.lat, 0) = 0 AND COALESCE(area_metadata.lat, 0) <> 0
+         THEN area_metadata ELSE metadata END AS metadata
+)
+FROM flat
 """
 
+def dumps_json(obj: Any) -> bytes:
+    """Serialize to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def loads_json(data: bytes) -> Any:
+    """Parse JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def encode_query(query: str) -> bytes:
+    """Encode a GraphQL query once as a JSON string literal"""
+    return dumps_json(query)
+
+# Static queries are encoded at import time rather than on every request
+COUNTRIES_QUERY_BYTES = encode_query(COUNTRIES_QUERY)
+CHILDREN_BY_UUID_QUERY_BYTES = encode_query(CHILDREN_BY_UUID_QUERY)
+CHILDREN_BY_PATH_QUERY_BYTES = encode_query(CHILDREN_BY_PATH_QUERY)
+
+def post_gql(session: requests.Session, url: str, query_bytes: bytes,
+             variables: Optional[Dict] = None, timeout: int = 30, stream: bool = False) -> requests.Response:
+    """POST a pre-encoded GraphQL query, serializing only the variables"""
+    body = b'{"query":' + query_bytes + b',"variables":' + dumps_json(variables or {}) + b'}'
+    return session.post(url, data=body, timeout=timeout, stream=stream)
+
+def stream_items(response: requests.Response, prefix: str) -> Tuple[List[Dict], bool]:
+    """Parse the array at prefix from a streamed response.
+
+    ijson reads the body straight off the socket and builds the top-level
+    values in its C backend, so the raw bytes are never buffered - the parsed
+    items themselves are all kept. Returns the items and whether the response
+    carried GraphQL errors.
+    """
+    response.raw.decode_content = True
+    top, *path = prefix.split(".")
+    document = dict(ijson.kvitems(response.raw, "", use_float=True))
+    items = document.get(top)
+    for key in path:
+        items = (items or {}).get(key)
+    return items or [], "errors" in document
+
 def load_config() -> Dict[str, Any]:
     """Load configuration from config.yaml"""
     config_path = Path(__file__).parent / "config.yaml"
@@ -103,18 +196,81 @@ def load_schema() -> str:
     schema_path = Path(__file__).parent / "schema.sql"
     return schema_path.read_text()
 
+def select_climb_fields(schema_sql: str) -> Dict[str, pa.DataType]:
+    """Trim CLIMB_FIELDS to the fields and struct sub-fields referenced by schema_sql"""
+    sql = re.sub(r"--[^\n]*", "", schema_sql)
+    # SELECT * (or struct.*) needs everything
+    if re.search(r"(SELECT|,|\.)\s*\*", sql, re.IGNORECASE):
+        return dict(CLIMB_FIELDS)
+
+    fields = {}
+    for name, field_type in CLIMB_FIELDS.items():
+        if name not in REQUIRED_CLIMB_FIELDS and not re.search(rf"\b{name}\b", sql, re.IGNORECASE):
+            continue
+        if pa.types.is_struct(field_type) and name not in REQUIRED_CLIMB_FIELDS:
+            used = [f for f in field_type if re.search(rf"\b{name}\.{f.name}\b", sql, re.IGNORECASE)]
+            # keep the whole struct if it's referenced without a sub-field
+            if used and not re.search(rf"\b{name}\b(?!\.)", sql, re.IGNORECASE):
+                field_type = pa.struct(used)
+        fields[name] = field_type
+    return fields
+
+def build_area_fields_fragment(climb_fields: Dict[str, pa.DataType]) -> str:
+    """Build the AreaFields GraphQL fragment selecting the given climb fields"""
+    lines = []
+    for name, field_type in climb_fields.items():
+        if pa.types.is_struct(field_type):
+            lines += [f"    {name} {{", *(f"      {f.name}" for f in field_type), "    }"]
+        else:
+            lines.append(f"    {name}")
+    climbs = "\n".join(lines)
+    return f"""
+fragment AreaFields on Area {{
+  uuid
+  area_name
+  pathTokens
+  metadata {{
+    lat
+    lng
+  }}
+  climbs {{
+{climbs}
+  }}
+}}
+"""
+
+def build_areas_schema(climb_fields: Dict[str, pa.DataType]) -> pa.Schema:
+    """Arrow schema for areas fetched with the given climb fields - loading skips type inference"""
+    return pa.schema([
+        ("uuid", pa.string()),
+        ("area_name", pa.string()),
+        ("pathTokens", pa.list_(pa.string())),
+        ("metadata", COORDINATES_TYPE),
+        ("climbs", pa.list_(pa.struct(list(climb_fields.items())))),
+    ])
+
+# Area fields and the Arrow load schema, trimmed to what schema.sql uses
+CLIMB_QUERY_FIELDS = select_climb_fields(load_schema())
+AREA_FIELDS_FRAGMENT = build_area_fields_fragment(CLIMB_QUERY_FIELDS)
+AREAS_SCHEMA = build_areas_schema(CLIMB_QUERY_FIELDS)
+
+# GraphQL query to fetch areas with climbs for a specific country or region
+AREAS_QUERY = """
+query GetAreas($tokens: [String!]!) {
+  areas(filter: {leaf_status: {isLeaf: true}, path_tokens: {tokens: $tokens}}) {
+    ...AreaFields
+  }
+}
+""" + AREA_FIELDS_FRAGMENT
+AREAS_QUERY_BYTES = encode_query(AREAS_QUERY)
+
 def fetch_children_by_uuid(api_url: str, uuid: str) -> List[str]:
     """Fetch child area names using UUID"""
     try:
-        response = requests.post(
-            api_url,
-            json={"query": CHILDREN_BY_UUID_QUERY, "variables": {"uuid": uuid}},
-            headers={"Content-Type": "application/json"},
-            timeout=30
-        )
+        response = post_gql(SESSION, api_url, CHILDREN_BY_UUID_QUERY_BYTES, {"uuid": uuid}, timeout=30)
         if response.status_code != 200:
             return []
-        data = response.json()
+        data = loads_json(response.content)
         if "errors" in data:
             return []
         children = data.get("data", {}).get("area", {}).get("children", [])
@@ -125,15 +281,10 @@ def fetch_children_by_uuid(api_url: str, uuid: str) -> List[str]:
 def fetch_children_by_path(api_url: str, tokens: List[str]) -> List[str]:
     """Fetch child area names using path tokens"""
     try:
-        response = requests.post(
-            api_url,
-            json={"query": CHILDREN_BY_PATH_QUERY, "variables": {"tokens": tokens}},
-            headers={"Content-Type": "application/json"},
-            timeout=30
-        )
+        response = post_gql(SESSION, api_url, CHILDREN_BY_PATH_QUERY_BYTES, {"tokens": tokens}, timeout=30)
         if response.status_code != 200:
             return []
-        data = response.json()
+        data = loads_json(response.content)
         if "errors" in data:
             return []
         areas = data.get("data", {}).get("areas", [])
@@ -144,74 +295,114 @@ def fetch_children_by_path(api_url: str, tokens: List[str]) -> List[str]:
         return []
 
 def fetch_region_climbs(api_url: str, tokens: List[str]) -> Tuple[Optional[List[Dict]], Optional[Any]]:
-    """Fetch climbs for a specific region (country or sub-region)"""
+    """Fetch leaf areas with their climbs for a specific region (country or sub-region)"""
     try:
-        response = requests.post(
-            api_url,
-            json={"query": AREAS_QUERY, "variables": {"tokens": tokens}},
-            headers={"Content-Type": "application/json"},
-            timeout=120
-        )
-    except requests.Timeout:
+        response = post_gql(SESSION, api_url, AREAS_QUERY_BYTES, {"tokens": tokens}, timeout=120, stream=True)
+        with response:
+            if response.status_code != 200:
+                return None, response.status_code
+            areas, has_errors = stream_items(response, "data.areas")
+    except (requests.Timeout, ReadTimeoutError):
         return None, 504
 
-    if response.status_code != 200:
-        return None, response.status_code
-
-    data = response.json()
-    if "errors" in data:
+    if has_errors:
         return None, "GraphQL Error"
 
-    areas = data.get("data", {}).get("areas", [])
-    climbs = []
-
-    # Extract climbs from areas and flatten
-    for area in areas:
-        for climb in area.get("climbs", []):
-            # Use area pathTokens if climb doesn't have them
-            if not climb.get("pathTokens"):
-                climb["pathTokens"] = area.get("pathTokens", [])
-
-            # Add area coordinates if climb doesn't have them
-            if not climb.get("metadata", {}).get("lat"):
-                if area.get("metadata", {}).get("lat"):
-                    climb.setdefault("metadata", {})["lat"] = area["metadata"]["lat"]
-                    climb["metadata"]["lng"] = area["metadata"]["lng"]
+    # areas are returned as-is; climbs are flattened in DuckDB (see CLIMBS_VIEW_SQL)
+    return areas, None
+
+def count_climbs(areas: List[Dict]) -> int:
+    """Count the climbs nested in a list of leaf areas"""
+    return sum(len(area.get("climbs") or []) for area in areas)
+
+def build_batched_areas_query(names: List[str]) -> Tuple[str, Dict[str, List[str]]]:
+    """Build one query aliasing the areas field per country (c0, c1, ...)"""
+    params = ", ".join(f"$t{i}: [String!]!" for i in range(len(names)))
+    fields = "\n".join(
+        f"  c{i}: areas(filter: {{leaf_status: {{isLeaf: true}}, path_tokens: {{tokens: $t{i}}}}}) {{\n"
+        f"    ...AreaFields\n"
+        f"  }}"
+        for i in range(len(names))
+    )
+    query = f"query GetAreasBatch({params}) {{\n{fields}\n}}\n" + AREA_FIELDS_FRAGMENT
+    variables = {f"t{i}": [name] for i, name in enumerate(names)}
+    return query, variables
 
-            climbs.append(climb)
+def fetch_countries_batch(api_url: str, names: List[str]) -> Tuple[Dict[str, List[Dict]], Optional[Any]]:
+    """Fetch areas for several countries in one request, returning the ones that succeeded"""
+    query, variables = build_batched_areas_query(names)
+    try:
+        response = post_gql(SESSION, api_url, encode_query(query), variables, timeout=120)
+    except requests.Timeout:
+        return {}, 504
 
-    return climbs, None
+    if response.status_code != 200:
+        return {}, response.status_code
+
+    data = loads_json(response.content)
+    errors = data.get("errors", [])
+    # errors without a path can't be attributed to a single country
+    if any(not e.get("path") for e in errors):
+        return {}, "GraphQL Error"
+    failed = {e["path"][0] for e in errors}
+
+    results = {}
+    for i, name in enumerate(names):
+        areas = (data.get("data") or {}).get(f"c{i}")
+        if f"c{i}" in failed or areas is None:
+            continue
+        results[name] = areas
+    return results, "GraphQL Error" if failed else None
+
+def fetch_country_batch(api_url: str, countries: List[Dict]) -> Dict[str, List[Dict]]:
+    """Fetch a batch of countries, falling back to per-country requests for failures"""
+    names = [c["areaName"] for c in countries]
+    results, error = fetch_countries_batch(api_url, names)
+    if error:
+        print(f"  batch of {len(names)} countries: failed ({error}), "
+              f"retrying {len(names) - len(results)} individually")
+
+    for country in countries:
+        name = country["areaName"]
+        if name in results:
+            print(f"  {name}: {count_climbs(results[name])} climbs")
+        else:
+            results[name] = fetch_region(api_url, [name], uuid=country["uuid"], depth=0)
+    return results
 
 def fetch_region(api_url: str, tokens: List[str], uuid: str = None, depth: int = 0) -> List[Dict]:
-    """Recursively fetch climbs, splitting into children on timeout"""
+    """Recursively fetch leaf areas with climbs, splitting into children on timeout"""
     indent = "  " * (depth + 1)
     region_name = " > ".join(tokens)
 
     # known large regions - skip straight to children
-    if tokens[-1] in LARGE_REGIONS and uuid:
+    if (tokens[-1] in LARGE_REGIONS and uuid) or region_name in TIMED_OUT_REGIONS:
         print(f"{indent}{region_name}: splitting (known large region)")
-        children = fetch_children_by_uuid(api_url, uuid)
+        if uuid:
+            children = fetch_children_by_uuid(api_url, uuid)
+        else:
+            children = fetch_children_by_path(api_url, tokens)
         if not children:
             print(f"{indent}  WARNING: no children found")
+            INCOMPLETE_COUNTRIES.add(tokens[0])
             return []
         print(f"{indent}  found {len(children)} children")
-        all_climbs = []
-        for child in children:
-            all_climbs.extend(fetch_region(api_url, tokens + [child], depth=depth + 1))
-        return all_climbs
+        return fetch_subregions(api_url, tokens, children, depth)
 
     # try fetching climbs directly
-    climbs, error = fetch_region_climbs(api_url, tokens)
+    areas, error = fetch_region_climbs(api_url, tokens)
 
     if error not in [502, 504]:
         if error:
             print(f"{indent}{region_name}: failed ({error})")
+            INCOMPLETE_COUNTRIES.add(tokens[0])
             return []
-        print(f"{indent}{region_name}: {len(climbs)} climbs")
-        return climbs
+        print(f"{indent}{region_name}: {count_climbs(areas)} climbs")
+        return areas
 
-    # timeout - split into children
+    # timeout - split into children, and remember to skip the attempt next time
     print(f"{indent}{region_name}: timeout, splitting into children...")
+    TIMED_OUT_REGIONS[region_name] = time.time()
 
     if uuid:
         children = fetch_children_by_uuid(api_url, uuid)
@@ -220,107 +411,262 @@ def fetch_region(api_url: str, tokens: List[str], uuid: str = None, depth: int =
 
     if not children:
         print(f"{indent}  WARNING: no children found for {region_name}")
+        INCOMPLETE_COUNTRIES.add(tokens[0])
         return []
 
     print(f"{indent}  found {len(children)} children")
-    all_climbs = []
-    for child in children:
-        all_climbs.extend(fetch_region(api_url, tokens + [child], depth=depth + 1))
-    return all_climbs
+    return fetch_subregions(api_url, tokens, children, depth)
 
-def fetch_all_climbs(api_url: str) -> List[Dict]:
-    """Fetch all climbs from GraphQL API"""
+def fetch_subregions(api_url: str, tokens: List[str], children: List[str], depth: int) -> List[Dict]:
+    """Fetch each child of a split region - in parallel when splitting a country"""
+    def fetch_child(child: str) -> List[Dict]:
+        return fetch_region(api_url, tokens + [child], depth=depth + 1)
+
+    # deeper splits stay serial so nested pools don't multiply the thread count
+    if depth > 0:
+        results = list(map(fetch_child, children))
+    else:
+        with ThreadPoolExecutor(max_workers=SUBREGION_CONCURRENCY) as pool:
+            results = list(pool.map(fetch_child, children))
+    return [area for areas in results for area in areas]
+
+def cache_path(cache_dir: Path, country: str) -> Path:
+    """Cache file for a country, keyed by the country and the AREAS_QUERY text"""
+    digest = hashlib.sha256(f"{AREAS_QUERY}\0{country}".encode()).hexdigest()[:16]
+    safe_name = re.sub(r"[^\w-]", "_", country)
+    return cache_dir / f"{safe_name}-{digest}.json.zst"
+
+def load_cached_areas(path: Path, ttl_hours: float) -> Optional[List[Dict]]:
+    """Load cached areas for a country, or None if missing, expired or unreadable"""
+    if not path.exists() or time.time() - path.stat().st_mtime > ttl_hours * 3600:
+        return None
+    try:
+        return loads_json(zstandard.ZstdDecompressor().decompress(path.read_bytes()))
+    except (zstandard.ZstdError, ValueError) as e:
+        # a corrupt entry is just a miss - the country is refetched and the file rewritten
+        print(f"  ignoring unreadable cache file {path.name}: {e}")
+        return None
+
+def save_cached_areas(path: Path, areas: List[Dict]):
+    """Write a country's areas to the cache, replacing any old entry atomically"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(zstandard.ZstdCompressor(level=3).compress(dumps_json(areas)))
+    os.replace(tmp_path, path)
+
+def load_timed_out_regions(path: Path, ttl_hours: float):
+    """Add regions that timed out in a previous run within ttl_hours to TIMED_OUT_REGIONS"""
+    if not path.exists():
+        return
+    try:
+        recorded = loads_json(path.read_bytes())
+    except ValueError:
+        return
+    # older files were a plain list without timestamps - let those expire
+    if not isinstance(recorded, dict):
+        return
+    cutoff = time.time() - ttl_hours * 3600
+    TIMED_OUT_REGIONS.update({region: ts for region, ts in recorded.items() if ts >= cutoff})
+
+def save_timed_out_regions(path: Path):
+    """Persist TIMED_OUT_REGIONS for the next run"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(dumps_json(dict(sorted(TIMED_OUT_REGIONS.items()))))
+
+def fetch_all_climbs(api_url: str, concurrency: int = 8, batch_size: int = 15,
+                     cache_dir: Optional[Path] = None, cache_ttl_hours: float = 24,
+                     timeout_memory_hours: float = 168) -> List[Dict]:
+    """Fetch all leaf areas with climbs from GraphQL API, fetching countries in parallel batches"""
     print(f"Fetching countries from {api_url}...")
 
-    response = requests.post(
-        api_url,
-        json={"query": COUNTRIES_QUERY},
-        headers={"Content-Type": "application/json"}
-    )
+    response = post_gql(SESSION, api_url, COUNTRIES_QUERY_BYTES, timeout=30)
 
     if response.status_code != 200:
         raise Exception(f"Countries query failed: {response.status_code} {response.text[:500]}")
 
-    data = response.json()
+    data = loads_json(response.content)
     if "errors" in data:
         raise Exception(f"GraphQL errors: {data['errors']}")
 
     countries = data.get("data", {}).get("countries", [])
     print(f"Found {len(countries)} countries")
 
-    all_climbs = []
-    for i, country in enumerate(countries, 1):
-        name, uuid = country["areaName"], country["uuid"]
-        print(f"[{i}/{len(countries)}] {name}")
-        climbs = fetch_region(api_url, [name], uuid=uuid, depth=0)
-        all_climbs.extend(climbs)
-
-    print(f"\nTotal climbs fetched: {len(all_climbs)}")
-    return all_climbs
-
-def filter_climbs(climbs: List[Dict], config: Dict) -> List[Dict]:
-    """Filter climbs by configured regions"""
+    # reuse cached countries, only fetching the ones missing or expired
+    INCOMPLETE_COUNTRIES.clear()
+    results = {}
+    if cache_dir:
+        load_timed_out_regions(cache_dir / "large_regions.json", timeout_memory_hours)
+        for c in countries:
+            cached = load_cached_areas(cache_path(cache_dir, c["areaName"]), cache_ttl_hours)
+            if cached is not None:
+                results[c["areaName"]] = cached
+        if results:
+            print(f"Loaded {len(results)} countries from cache {cache_dir}")
+    pending = [c for c in countries if c["areaName"] not in results]
+
+    # large countries are split on their own; the rest share aliased batch queries
+    large_names = LARGE_REGIONS | TIMED_OUT_REGIONS.keys()
+    large = [c for c in pending if c["areaName"] in large_names]
+    small = [c for c in pending if c["areaName"] not in large_names]
+    batches = [small[i:i + batch_size] for i in range(0, len(small), batch_size)]
+
+    # requests are independent - run them concurrently on the shared session
+    done = len(results)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(fetch_region, api_url, [c["areaName"]], uuid=c["uuid"], depth=0): [c]
+            for c in large
+        }
+        futures.update({pool.submit(fetch_country_batch, api_url, batch): batch for batch in batches})
+        for future in as_completed(futures):
+            batch = futures[future]
+            result = future.result()
+            if isinstance(result, list):
+                result = {batch[0]["areaName"]: result}
+            results.update(result)
+            done += len(batch)
+            print(f"[{done}/{len(countries)}] {', '.join(c['areaName'] for c in batch)}: done")
+
+    # only cache countries where every region was fetched - a partial country
+    # would otherwise be served from the cache for cache_ttl_hours
+    if cache_dir:
+        save_timed_out_regions(cache_dir / "large_regions.json")
+        for c in pending:
+            if results[c["areaName"]] and c["areaName"] not in INCOMPLETE_COUNTRIES:
+                save_cached_areas(cache_path(cache_dir, c["areaName"]), results[c["areaName"]])
+
+    # keep country order stable regardless of completion order
+    all_areas = []
+    for country in countries:
+        all_areas.extend(results[country["areaName"]])
+
+    print(f"\nTotal climbs fetched: {count_climbs(all_areas)}")
+    return all_areas
+
+def filter_climbs(areas: List[Dict], config: Dict) -> List[Dict]:
+    """Filter areas (and so their climbs) by configured regions"""
     regions = config.get("export", {}).get("regions", [])
     if not regions:
-        return climbs
+        return areas
 
-    filtered = [c for c in climbs if c.get("pathTokens") and c["pathTokens"][0] in regions]
-    print(f"Filtered to regions {regions}: {len(filtered)} climbs")
+    regions_set = frozenset(regions)
+    filtered = [a for a in areas if (p := a.get("pathTokens")) and p[0] in regions_set]
+    print(f"Filtered to regions {regions}: {count_climbs(filtered)} climbs")
     return filtered
 
-def export_to_parquet(climbs: List[Dict], config: Dict):
+def arrow_reader(result: duckdb.DuckDBPyConnection, batch_size: int) -> pa.RecordBatchReader:
+    """Stream an executed query as Arrow record batches"""
+    # to_arrow_reader replaces the deprecated fetch_record_batch in newer DuckDB releases
+    if hasattr(result, "to_arrow_reader"):
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
+
+def restore_uuid_columns(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Wrap the 16-byte blob columns that schema types as arrow.uuid"""
+    columns = [
+        pa.ExtensionArray.from_storage(pa.uuid(), column.cast(pa.binary(16)))
+        if field.type == pa.uuid() else column
+        for column, field in zip(batch.columns, schema)
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def export_to_parquet(areas: List[Dict], config: Dict):
     """Convert climbs to Parquet using DuckDB"""
     output_config = config.get("export", {}).get("output", {})
     filename = output_config.get("filename", "openbeta-climbs.parquet")
-    compression = output_config.get("compression", "snappy")
+    compression = output_config.get("compression", "zstd")
+    compression_level = output_config.get("zstd_compression_level", 3) if compression == "zstd" else None
+    row_group_size = output_config.get("row_group_size", 122_880)
 
     print(f"\nTransforming data with DuckDB...")
 
-    # Initialize DuckDB
-    con = duckdb.connect(database=":memory:")
-
-    # Load climbs as JSON via temp file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as tmp:
-        json.dump(climbs, tmp)
-        tmp_path = tmp.name
-
-    try:
-        # Measure JSON size for comparison
-        json_size_mb = Path(tmp_path).stat().st_size / (1024 * 1024)
-        print(f"  JSON intermediate size: {json_size_mb:.2f} MB")
-
-        con.execute(f"CREATE TABLE climbs AS SELECT * FROM read_json_auto('{tmp_path}')")
-        print(f"  Loaded {len(climbs)} climbs into DuckDB")
-    finally:
-        Path(tmp_path).unlink()  # Clean up temp file
+    # Initialize DuckDB - insertion order isn't needed, which frees it to reorder pipelines
+    duckdb_config = config.get("export", {}).get("duckdb", {})
+    settings = {
+        "threads": duckdb_config.get("threads") or os.cpu_count(),
+        "preserve_insertion_order": duckdb_config.get("preserve_insertion_order", False),
+        "temp_directory": duckdb_config.get("temp_directory", str(Path(tempfile.gettempdir()) / "duckdb")),
+    }
+    if duckdb_config.get("memory_limit"):
+        settings["memory_limit"] = duckdb_config["memory_limit"]
+    con = duckdb.connect(database=duckdb_config.get("database", ":memory:"), config=settings)
+
+    # Estimate JSON size for comparison from ~100 areas spread across all countries
+    json_sample = areas[::max(1, len(areas) // 100)]
+    json_size_mb = len(dumps_json(json_sample)) * len(areas) / len(json_sample) / (1024 * 1024)
+    print(f"  JSON equivalent size (estimated): {json_size_mb:.2f} MB")
+
+    # Load areas via Arrow - DuckDB scans the registered table directly
+    total_climbs = count_climbs(areas)
+    areas_table = pa.Table.from_pylist(areas, schema=AREAS_SCHEMA)
+    arrow_size_mb = areas_table.nbytes / (1024 * 1024)
+    con.register("areas", areas_table)
+    uuids_parse = con.execute(
+        "SELECT count(climb.uuid) = count(TRY_CAST(climb.uuid AS UUID)) FROM (SELECT UNNEST(climbs) AS climb FROM areas)"
+    ).fetchone()[0]
+    if not uuids_parse:
+        print("  WARNING: some climb ids aren't UUIDs - keeping climb ids as VARCHAR")
+    # earlier versions left a persistent climbs view over areas in file databases
+    con.execute("DROP VIEW IF EXISTS main.climbs")
+    con.execute(CLIMBS_VIEW_SQL.format(uuid_type="UUID" if uuids_parse else "VARCHAR"))
+    print(f"  Loaded {total_climbs} climbs into DuckDB ({arrow_size_mb:.2f} MB in memory)")
 
     # Load and execute schema transformation
     schema_sql = load_schema()
     print(f"  Applying schema transformation...")
 
-    # Export to Parquet
-    output_path = Path(filename)
-    print(f"\nExporting to {output_path}...")
-
-    con.execute(f"""
-        COPY ({schema_sql})
-        TO '{output_path}'
-        (FORMAT PARQUET, COMPRESSION '{compression}')
-    """)
+    # Export to Parquet - straight to S3 when configured, otherwise a local file
+    s3_uri = output_config.get("s3_uri")
+    if s3_uri:
+        # credentials come from the standard AWS_* environment variables
+        filesystem = pafs.S3FileSystem(region=output_config.get("s3_region") or os.environ.get("AWS_REGION"))
+        output_path = s3_uri.removeprefix("s3://")
+    else:
+        filesystem = None
+        output_path = Path(filename)
+    output_name = s3_uri or output_path
+    print(f"\nExporting to {output_name}...")
+
+    # DuckDB hands UUIDs to Arrow as strings - select them as 16-byte blobs instead
+    # and wrap those as arrow.uuid, so the Parquet columns keep the UUID logical type
+    uuid_columns = [row[0] for row in con.execute(f"DESCRIBE {schema_sql}").fetchall() if row[1] == "UUID"]
+    export_sql = schema_sql
+    if uuid_columns:
+        blobs = ", ".join(f"unhex(replace(\"{c}\"::VARCHAR, '-', '')) AS \"{c}\"" for c in uuid_columns)
+        export_sql = f"SELECT * REPLACE ({blobs}) FROM (\n{schema_sql.rstrip().rstrip(';')}\n)"
+
+    # Stream the transform out in batches of one row group each, so schema_sql only runs once
+    reader = arrow_reader(con.execute(export_sql), row_group_size)
+    output_schema = reader.schema
+    for name in uuid_columns:
+        output_schema = output_schema.set(output_schema.get_field_index(name), pa.field(name, pa.uuid()))
+    sample = None
+    with pq.ParquetWriter(output_path, output_schema, filesystem=filesystem, compression=compression,
+                          compression_level=compression_level) as writer:
+        for batch in reader:
+            if uuid_columns:
+                batch = restore_uuid_columns(batch, output_schema)
+            if sample is None:
+                sample = batch.slice(0, 5)
+            writer.write_batch(batch, row_group_size=row_group_size)
 
     # Get file size and show comparison
-    parquet_size_mb = output_path.stat().st_size / (1024 * 1024)
+    if filesystem:
+        parquet_size_mb = filesystem.get_file_info(output_path).size / (1024 * 1024)
+    else:
+        parquet_size_mb = output_path.stat().st_size / (1024 * 1024)
     compression_ratio = json_size_mb / parquet_size_mb if parquet_size_mb > 0 else 0
     space_saved_pct = (1 - parquet_size_mb / json_size_mb) * 100 if json_size_mb > 0 else 0
 
-    print(f"Export complete: {output_path} ({parquet_size_mb:.2f} MB)")
+    print(f"Export complete: {output_name} ({parquet_size_mb:.2f} MB)")
     print(f"  Size comparison: JSON {json_size_mb:.2f} MB → Parquet {parquet_size_mb:.2f} MB")
     print(f"  Compression: {compression_ratio:.1f}x smaller ({space_saved_pct:.1f}% space saved)")
 
     # Write stats for GitHub Actions
     stats = {
-        "total_climbs": len(climbs),
+        "total_climbs": total_climbs,
         "json_size_mb": round(json_size_mb, 2),
+        "arrow_size_mb": round(arrow_size_mb, 2),
         "parquet_size_mb": round(parquet_size_mb, 2),
         "compression_ratio": round(compression_ratio, 1),
         "space_saved_pct": round(space_saved_pct, 1)
@@ -330,18 +676,22 @@ def export_to_parquet(climbs: List[Dict], config: Dict):
 
     # Show sample
     print(f"\nSample data (first 5 rows):")
-    result = con.execute(f"SELECT * FROM ({schema_sql}) LIMIT 5")
-    cols = [d[0] for d in result.description]
-    rows = result.fetchall()
+    cols = output_schema.names
+    rows = sample.to_pylist() if sample is not None else []
     print(" | ".join(cols))
     print("-" * min(120, len(" | ".join(cols))))
     for row in rows:
-        print(" | ".join(str(v)[:30] for v in row))
+        print(" | ".join(str(v)[:30] for v in row.values()))
 
     con.close()
 
 def main():
     """Main export process"""
+    parser = argparse.ArgumentParser(description="Export OpenBeta climbs to Parquet")
+    parser.add_argument("--cache-dir", type=Path, default=Path(".cache/openbeta"),
+                        help="directory for cached per-country API responses (default: .cache/openbeta)")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("OpenBeta Parquet Exporter")
     print("=" * 60)
@@ -352,21 +702,28 @@ def main():
         api_url = config["export"]["api_url"]
 
         # Fetch data
-        climbs = fetch_all_climbs(api_url)
+        areas = fetch_all_climbs(
+            api_url,
+            concurrency=config["export"].get("concurrency", 8),
+            batch_size=config["export"].get("batch_size", 15),
+            cache_dir=args.cache_dir,
+            cache_ttl_hours=config["export"].get("cache_ttl_hours", 24),
+            timeout_memory_hours=config["export"].get("timeout_memory_hours", 168),
+        )
 
-        if not climbs:
+        if not count_climbs(areas):
             print("WARNING: No climbs found!")
             sys.exit(1)
 
         # Apply filters
-        climbs = filter_climbs(climbs, config)
+        areas = filter_climbs(areas, config)
 
-        if not climbs:
+        if not count_climbs(areas):
             print("WARNING: No climbs remained after filtering!")
             sys.exit(1)
 
         # Export to Parquet
-        export_to_parquet(climbs, config)
+        export_to_parquet(areas, config)
 
         print("\nExport successful!")
 
@@ -376,5 +733,8 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
+    finally:
+        SESSION.close()
+
 if __name__ == "__main__":
     main()
@@ -6,12 +6,23 @@ import sys
 from uuid import UUID
 import duckdb
 
+try:
+    import orjson
+except ImportError:  # optional - falls back to stdlib json
+    orjson = None
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, UUID):
             return str(o)
         return super().default(o)
 
+def dumps_feature(feature: dict) -> str:
+    """Serialize one GeoJSON feature, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(feature).decode()
+    return json.dumps(feature, cls=JSONEncoder)
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python parquet2json.py <output.json|output.geojson> [input.parquet]")
@@ -21,23 +32,30 @@ def main():
     input_file = sys.argv[2] if len(sys.argv) > 2 else "openbeta-climbs.parquet"
 
     if output.endswith(".geojson"):
-        rows = duckdb.execute(f"SELECT * FROM '{input_file}' WHERE latitude IS NOT NULL").fetchall()
-        cols = [d[0] for d in duckdb.execute(f"DESCRIBE SELECT * FROM '{input_file}'").fetchall()]
-
-        features = []
-        for row in rows:
-            props = dict(zip(cols, row))
-            lat, lng = props.pop("latitude"), props.pop("longitude")
-            features.append({
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [lng, lat]},
-                "properties": props
-            })
+        # stream features batch by batch instead of holding every row in memory
+        result = duckdb.execute(f"SELECT * FROM '{input_file}' WHERE latitude IS NOT NULL")
+        # to_arrow_reader replaces the deprecated fetch_record_batch in newer DuckDB releases
+        if hasattr(result, "to_arrow_reader"):
+            reader = result.to_arrow_reader(10_000)
+        else:
+            reader = result.fetch_record_batch(10_000)
 
         with open(output, "w") as f:
-            json.dump({"type": "FeatureCollection", "features": features}, f, cls=JSONEncoder)
+            f.write('{"type":"FeatureCollection","features":[')
+            first = True
+            for batch in reader:
+                for props in batch.to_pylist():
+                    lat, lng = props.pop("latitude"), props.pop("longitude")
+                    feature = {
+                        "type": "Feature",
+                        "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                        "properties": props
+                    }
+                    f.write(("" if first else ",") + dumps_feature(feature))
+                    first = False
+            f.write("]}")
     else:
-        duckdb.execute(f"COPY (SELECT * FROM '{input_file}') TO '{output}'")
+        duckdb.execute(f"COPY (SELECT * FROM '{input_file}') TO '{output}' (FORMAT JSON, ARRAY true)")
 
     print(f"Wrote {output}")
 
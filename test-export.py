@@ -3,79 +3,188 @@
 Quick test of the export functionality with limited data
 """
 
+import hashlib
 import json
+import os
+import time
 import requests
 import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # optional - falls back to stdlib json
+    orjson = None
+
+# Shared HTTP session - keep-alive connections and gzip-compressed responses.
+# pool_maxsize caps the kept-alive connections per host (pool_connections counts hosts).
+POOL_MAXSIZE = 32
+SESSION = requests.Session()
+SESSION.headers.update({"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=POOL_MAXSIZE))
 
-# Test with just one area
-TEST_QUERY = """
-query {
-  area(uuid: "0f1eddf1-5a79-556e-92f6-0d91627e1f2f") {
+API_URL = "https://api.openbeta.io/graphql"
+
+# Test with just one area - more uuids are fetched in aliased batches
+TEST_AREA_UUIDS = ["0f1eddf1-5a79-556e-92f6-0d91627e1f2f"]
+MAX_AREAS_PER_REQUEST = 50
+
+TEST_AREA_FIELDS = """
+fragment TestAreaFields on Area {
+  uuid
+  area_name
+  pathTokens
+  metadata { lat lng }
+  climbs {
     uuid
-    area_name
-    pathTokens
+    name
+    length
+    grades { yds vscale }
+    type { sport trad bouldering }
     metadata { lat lng }
-    climbs {
-      uuid
-      name
-      fa
-      length
-      boltsCount
-      grades { yds vscale french }
-      type { sport trad bouldering alpine tr }
-      safety
-      metadata { lat lng }
-      content { description }
-      pathTokens
-    }
+    pathTokens
   }
 }
 """
 
+def build_test_query(count: int) -> str:
+    """Build one query aliasing area(uuid:) per uuid (a0, a1, ...)"""
+    params = ", ".join(f"$u{i}: ID!" for i in range(count))
+    fields = "\n".join(f"  a{i}: area(uuid: $u{i}) {{ ...TestAreaFields }}" for i in range(count))
+    return f"query GetTestAreas({params}) {{\n{fields}\n}}\n" + TEST_AREA_FIELDS
+
+# Arrow schema matching the climb fields in TEST_AREA_FIELDS
+COORDINATES_TYPE = pa.struct([("lat", pa.float64()), ("lng", pa.float64())])
+CLIMBS_SCHEMA = pa.schema([
+    ("uuid", pa.string()),
+    ("name", pa.string()),
+    ("length", pa.int32()),
+    ("grades", pa.struct([("yds", pa.string()), ("vscale", pa.string())])),
+    ("type", pa.struct([("sport", pa.bool_()), ("trad", pa.bool_()), ("bouldering", pa.bool_())])),
+    ("metadata", COORDINATES_TYPE),
+    ("pathTokens", pa.list_(pa.string())),
+])
+AREAS_SCHEMA = pa.schema([
+    ("uuid", pa.string()),
+    ("area_name", pa.string()),
+    ("pathTokens", pa.list_(pa.string())),
+    ("metadata", COORDINATES_TYPE),
+    ("climbs", pa.list_(pa.struct(list(CLIMBS_SCHEMA)))),
+])
+
+# Responses are cached locally so reruns don't need the network
+CACHE_DIR = Path(".cache")
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+def parse_json(body: bytes):
+    """Parse JSON bytes, using orjson when available"""
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+def fetch_test_batch(uuids: list) -> dict:
+    """Fetch a batch of areas by query hash, registering the full query if the server lacks it"""
+    query = build_test_query(len(uuids))
+    key = hashlib.blake2b((query + "".join(uuids)).encode(), digest_size=16).hexdigest()
+    cache_path = CACHE_DIR / f"{key}.json.zst"
+    if cache_path.exists() and time.time() - cache_path.stat().st_mtime < CACHE_TTL_SECONDS:
+        try:
+            return parse_json(zstandard.ZstdDecompressor().decompress(cache_path.read_bytes()))
+        except (zstandard.ZstdError, ValueError):
+            pass  # corrupt cache file - refetch and overwrite it
+
+    # automatic persisted query - the server caches the query text under its hash
+    payload = {
+        "variables": {f"u{i}": uuid for i, uuid in enumerate(uuids)},
+        "extensions": {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(query.encode()).hexdigest()}},
+    }
+    body = SESSION.post(API_URL, json=payload).content
+    data = parse_json(body)
+    messages = {e.get("message") for e in data.get("errors", [])}
+    if messages & {"PersistedQueryNotFound", "PersistedQueryNotSupported"}:
+        body = SESSION.post(API_URL, json={**payload, "query": query}).content
+        data = parse_json(body)
+
+    if "errors" not in data:
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(zstandard.ZstdCompressor(level=3).compress(body))
+        os.replace(tmp_path, cache_path)
+    return data
+
 print("Testing OpenBeta Parquet Exporter...")
 print("=" * 60)
 
 # Fetch test data
 print("\n1. Fetching test data from GraphQL API...")
-response = requests.post(
-    "https://api.openbeta.io/graphql",
-    json={"query": TEST_QUERY},
-    headers={"Content-Type": "application/json"}
-)
-
-data = response.json()
-if "errors" in data:
-    print(f"ERROR: {data['errors']}")
-    exit(1)
-
-area = data["data"]["area"]
-climbs = area.get("climbs", [])
+# Batches are independent, so fetch them concurrently over the pooled session -
+# one worker per batch, up to the connections the pool keeps for the API host
+batches = [TEST_AREA_UUIDS[start:start + MAX_AREAS_PER_REQUEST]
+           for start in range(0, len(TEST_AREA_UUIDS), MAX_AREAS_PER_REQUEST)]
+with ThreadPoolExecutor(max_workers=max(1, min(len(batches), POOL_MAXSIZE))) as executor:
+    results = list(executor.map(fetch_test_batch, batches))
 
-# Add pathTokens from area if climbs don't have them
-for climb in climbs:
-    if not climb.get("pathTokens"):
-        climb["pathTokens"] = area.get("pathTokens", [])
-    if not climb.get("metadata", {}).get("lat"):
-        climb.setdefault("metadata", {})
-        climb["metadata"]["lat"] = area["metadata"]["lat"]
-        climb["metadata"]["lng"] = area["metadata"]["lng"]
+areas = []
+for batch, data in zip(batches, results):
+    if "errors" in data:
+        print(f"ERROR: {data['errors']}")
+        exit(1)
+    areas.extend(data["data"][f"a{i}"] for i in range(len(batch)))
 
-print(f"✓ Fetched {len(climbs)} climbs from {area['area_name']}")
+for area in areas:
+    print(f"✓ Fetched {len(area.get('climbs') or [])} climbs from {area['area_name']}")
 
 # Test DuckDB transformation
 print("\n2. Testing DuckDB transformation...")
-con = duckdb.connect(database=":memory:")
-con.execute("CREATE TABLE climbs AS SELECT * FROM read_json_auto(?)", [json.dumps(climbs)])
+# File-backed so the buffer manager can spill to disk instead of competing for RAM;
+# COPY below sorts explicitly, so insertion order need not be preserved
+con = duckdb.connect(database="test-export.duckdb", config={
+    "threads": os.cpu_count(),
+    "memory_limit": "4GB",
+    "preserve_insertion_order": False,
+})
+# connection-local, so it can't go through config; keeps COPY from redrawing a bar
+con.execute("SET enable_progress_bar = false")
+
+# Sortable SMALLINT for a YDS grade: 4 steps per number so letter grades fit between
+# (5.9 -> 36, 5.10a -> 40, 5.15d -> 63); +/- grades map to the bare number, non-YDS grades to NULL
+con.execute(r"""
+CREATE OR REPLACE TEMP MACRO yds_ord(g) AS CAST(
+    TRY_CAST(regexp_extract(g, '^5\.(\d+)', 1) AS SMALLINT) * 4
+    + COALESCE(list_position(['a', 'b', 'c', 'd'], regexp_extract(g, '^5\.\d+([a-d])', 1)) - 1, 0)
+AS SMALLINT)
+""")
 
+# Climbs are flattened inside DuckDB, filling missing pathTokens and coordinates
+# (lat and lng together, when lat is 0/NULL) from the parent area - same as CLIMBS_VIEW_SQL in export.py
 test_schema = """
+WITH area_climbs AS (
+    SELECT pathTokens AS area_pathTokens, metadata AS area_metadata, UNNEST(climbs) AS climb
+    FROM areas
+), flat AS (
+    SELECT area_pathTokens, area_metadata, UNNEST(climb)
+    FROM area_climbs
+), climbs AS (
+    SELECT * EXCLUDE (area_pathTokens, area_metadata) REPLACE (
+        COALESCE(NULLIF(pathTokens, []), area_pathTokens) AS pathTokens,
+        CASE WHEN COALESCE(metadata.lat, 0) = 0 AND COALESCE(area_metadata.lat, 0) <> 0
+             THEN area_metadata ELSE metadata END AS metadata
+    )
+    FROM flat
+)
 SELECT
     uuid AS climb_id,
     name AS climb_name,
     COALESCE(grades.yds, '') AS grade_yds,
+    yds_ord(grades.yds) AS grade_yds_ord,
     COALESCE(grades.vscale, '') AS grade_vscale,
-    COALESCE(type.sport, false) AS is_sport,
-    COALESCE(type.trad, false) AS is_trad,
-    COALESCE(type.bouldering, false) AS is_boulder,
+    -- bit 0 sport, bit 1 trad, bit 2 bouldering
+    COALESCE(type.sport, false)::UTINYINT
+        | (COALESCE(type.trad, false)::UTINYINT << 1)
+        | (COALESCE(type.bouldering, false)::UTINYINT << 2) AS climb_type_bits,
     COALESCE(list_element(pathTokens, 1), '') AS country,
     COALESCE(list_element(pathTokens, 2), '') AS state,
     COALESCE(metadata.lat, 0.0) AS latitude,
@@ -85,24 +194,41 @@ FROM climbs
 LIMIT 10
 """
 
-result = con.execute(test_schema)
-rows = result.fetchall()
-print(f"✓ Transformed {len(rows)} climbs")
+# All areas go in as one Arrow table and are transformed in a single statement;
+# materialized once so the preview and the Parquet export see the same rows
+con.register("areas", pa.Table.from_pylist(areas, schema=AREAS_SCHEMA))
+con.execute(f"CREATE TEMP TABLE test_out AS {test_schema}")
+transformed = con.execute("SELECT COUNT(*) FROM test_out").fetchone()[0]
+print(f"✓ Transformed {transformed} climbs")
 print("\nSample data:")
-for row in rows[:5]:
-    print(f"  {row[1]} | {row[2]} | {row[7]} | {row[8]} | {row[9]:.4f} | {row[10]:.4f}")
+# Only the first record batch is pulled for the preview
+result = con.execute("SELECT * FROM test_out")
+# to_arrow_reader replaces the deprecated fetch_record_batch in newer DuckDB releases
+reader = result.to_arrow_reader(64) if hasattr(result, "to_arrow_reader") else result.fetch_record_batch(64)
+preview = next(iter(reader), None)
+for row in (preview.slice(0, 5).to_pylist() if preview is not None else []):
+    print(f"  {row['climb_name']} | {row['grade_yds']} | {row['country']} | {row['state']} | "
+          f"{row['latitude']:.4f} | {row['longitude']:.4f}")
 
 # Test Parquet export
 print("\n3. Testing Parquet export...")
-con.execute(f"COPY ({test_schema}) TO 'test-output.parquet' (FORMAT PARQUET, COMPRESSION 'snappy')")
+# Sorting by location clusters repeated values, so dictionary/RLE encoding packs tighter
+written = con.execute("""
+    COPY (SELECT * FROM test_out ORDER BY country, state, climb_name)
+    TO 'test-output.parquet'
+    (FORMAT PARQUET, COMPRESSION 'zstd', COMPRESSION_LEVEL 1, ROW_GROUP_SIZE 1000000)
+""").fetchone()[0]
 
-import os
-size = os.path.getsize('test-output.parquet')
-print(f"✓ Created test-output.parquet ({size:,} bytes)")
+size = Path("test-output.parquet").stat().st_size
+print(f"✓ Created test-output.parquet ({written} rows, {size:,} bytes)")
 
 # Read it back
 print("\n4. Verifying Parquet file...")
-verify = con.execute("SELECT COUNT(*) FROM 'test-output.parquet'").fetchone()[0]
+# Footer-only check - no column data is read
+verify = pq.ParquetFile("test-output.parquet").metadata.num_rows
+if verify != written:
+    print(f"ERROR: wrote {written} rows but the Parquet footer reports {verify}")
+    exit(1)
 print(f"✓ Successfully read back {verify} rows from Parquet")
 
 print("\n" + "=" * 60)